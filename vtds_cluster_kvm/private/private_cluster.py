@@ -24,12 +24,19 @@
 
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from os import urandom
 from os.path import (
     join as path_join,
     dirname
 )
-from random import randint
-from yaml import safe_dump
+from yaml import dump
+try:
+    # Use the LibYAML C emitter when it is available, the blade
+    # config can be large and the pure Python emitter is slow.
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
 
 from vtds_base import (
     ContextualError,
@@ -63,18 +70,49 @@ class PrivateCluster:
             self.build_dir, 'blade_core_config.yaml'
         )
         self.prepared = False
+        self.vm_xml_template = None
+        self.blade_counts = {}
+        self.blade_ips = {}
 
-    def __add_endpoint_ips(self, network):
+    def __blade_count(self, virtual_blades, blade_class):
+        """Look up the number of Virtual Blades in a given blade
+        class, asking the provider layer only the first time a given
+        blade class is seen.
+
+        """
+        if blade_class not in self.blade_counts:
+            self.blade_counts[blade_class] = virtual_blades.blade_count(
+                blade_class
+            )
+        return self.blade_counts[blade_class]
+
+    def __blade_ips(self, virtual_blades, blade_class, interconnect):
+        """Look up the list of IP addresses of all of the Virtual
+        Blades in a given blade class on a given Blade Interconnect,
+        asking the provider layer only the first time a given blade
+        class and interconnect pair is seen.
+
+        """
+        key = (blade_class, interconnect)
+        if key not in self.blade_ips:
+            self.blade_ips[key] = [
+                virtual_blades.blade_ip(blade_class, instance, interconnect)
+                for instance in range(
+                    0, self.__blade_count(virtual_blades, blade_class)
+                )
+            ]
+        return self.blade_ips[key]
+
+    def __add_endpoint_ips(self, network, virtual_blades):
         """Go through the list of connected blade classes for a
         network and use the list of endpoint IPs represented by all of
-        the blades in each of those classes to compose a comprehensive
-        list of endpoint IPs for the overlay network we are going to
-        build for the network. Add that list under the 'endpoint_ips'
-        key in the network and return the modified network to the
-        caller.
+        the blades ('virtual_blades') in each of those classes to
+        compose a comprehensive list of endpoint IPs for the overlay
+        network we are going to build for the network. Add that list
+        under the 'endpoint_ips' key in the network and return the
+        modified network to the caller.
 
         """
-        virtual_blades = self.provider_api.get_virtual_blades()
         try:
             interconnect = network['blade_interconnect']
         except KeyError as err:
@@ -89,9 +127,11 @@ class PrivateCluster:
             else blade_classes
         )
         network['endpoint_ips'] = [
-            virtual_blades.blade_ip(blade_class, instance, interconnect)
+            blade_ip
             for blade_class in blade_classes
-            for instance in range(0, virtual_blades.blade_count(blade_class))
+            for blade_ip in self.__blade_ips(
+                virtual_blades, blade_class, interconnect
+            )
         ]
         return network
 
@@ -99,49 +139,64 @@ class PrivateCluster:
     def __clean_deleted_interfaces(node_class_config):
         """Go through the network interfaces in a node class
         configuration and remove any that have the 'deleted' flag
-        set. Return the resulting config.
+        set. Return the resulting config. The interfaces are only
+        rebuilt if something actually needs to be removed.
 
         """
-        net_interfaces = {
-            key: interface
-            for key, interface in node_class_config.get(
-                    'network_interfaces', {}
-            ).items()
-            if not interface.get('delete', False)
-        }
-        node_class_config['network_interfaces'] = net_interfaces
+        net_interfaces = node_class_config.setdefault(
+            'network_interfaces', {}
+        )
+        if any(
+                interface.get('delete', False)
+                for interface in net_interfaces.values()
+        ):
+            node_class_config['network_interfaces'] = {
+                key: interface
+                for key, interface in net_interfaces.items()
+                if not interface.get('delete', False)
+            }
         return node_class_config
 
     @staticmethod
     def __clean_deleted_partitions(disk):
         """Go through any partitions that might be defined on a disk
-        and remove any that have been deleted.
+        and remove any that have been deleted. The partitions are only
+        rebuilt if something actually needs to be removed.
 
         """
-        partitions = {
-            key: partition
-            for key, partition in disk.get('partitions', {}).items()
-            if not partition.get('delete', False)
-        }
-        disk['partitions'] = partitions
+        partitions = disk.setdefault('partitions', {})
+        if any(
+                partition.get('delete', False)
+                for partition in partitions.values()
+        ):
+            disk['partitions'] = {
+                key: partition
+                for key, partition in partitions.items()
+                if not partition.get('delete', False)
+            }
         return disk
 
     def __clean_deleted_disks(self, node_class_config):
         """Go through the additional disks in a node class
         configuration and remove any that have the 'deleted' flag
-        set. Return the resulting config.
+        set. Return the resulting config. The disks are only rebuilt
+        if something actually needs to be removed.
 
         """
-        virtual_machine = node_class_config.get('virtual_machine', {})
-        additional_disks = {
-            key: self.__clean_deleted_partitions(disk)
-            for key, disk in virtual_machine.get(
-                    'additional_disks', {}
-            ).items()
-            if not disk.get('delete', False)
-        }
-        virtual_machine['additional_disks'] = additional_disks
-        node_class_config['virtual_machine'] = virtual_machine
+        virtual_machine = node_class_config.setdefault('virtual_machine', {})
+        additional_disks = virtual_machine.setdefault('additional_disks', {})
+        if any(
+                disk.get('delete', False)
+                for disk in additional_disks.values()
+        ):
+            additional_disks = {
+                key: disk
+                for key, disk in additional_disks.items()
+                if not disk.get('delete', False)
+            }
+            virtual_machine['additional_disks'] = additional_disks
+        for disk in additional_disks.values():
+            self.__clean_deleted_partitions(disk)
         return node_class_config
 
     @staticmethod
@@ -160,13 +215,12 @@ class PrivateCluster:
             )
         return node_classes
 
-    def __expand_node_classes(self, blade_config):
+    def __expand_node_classes(self, node_classes):
         """Expand the node class inheritance tree found in the
-        provided blade_config data and replace the node classes found
+        provided node classes and replace the node classes found
         there with their expanded versions.
 
         """
-        node_classes = self.__get_node_classes(blade_config)
         for key, node_class in node_classes.items():
             # Expand the inheritance tree for Virtual Node classes and put
             # the expanded result back into the configuration. That way,
@@ -183,17 +237,17 @@ class PrivateCluster:
             node_classes[key] = expanded_config
 
     @staticmethod
-    def __random_mac(prefix="52:54:00"):
-        """Generate a MAC address using a specified prefix specified
-        as a string containing colon separated hexadecimal octet
-        values for the length of the desired prefix. By default use
-        the KVM reserved prefix '52:54:00'.
+    def __mac_prefix_octets(prefix="52:54:00"):
+        """Parse a MAC address prefix specified as a string containing
+        colon separated hexadecimal octet values for the length of the
+        desired prefix and return the octet values as bytes. By
+        default use the KVM reserved prefix '52:54:00'.
 
         """
         try:
-            prefix_octets = [
+            prefix_octets = bytes(
                 int(octet, base=16) for octet in prefix.split(':')
-            ]
+            )
         except Exception as err:
             raise ContextualError(
                 "internal error: parsing MAC prefix '%s' failed - %s" % (
@@ -205,22 +259,38 @@ class PrivateCluster:
                 "internal error: MAC address prefix '%s' has too "
                 "many octets" % prefix
             )
-        mac_binary = prefix_octets + [
-            randint(0x00, 0xff) for i in range(0, 6 - len(prefix_octets))
+        return prefix_octets
+
+    @staticmethod
+    def __random_macs(count, prefix_octets):
+        """Generate a list of 'count' MAC addresses starting with the
+        octets in 'prefix_octets' (see __mac_prefix_octets()). The
+        random octets for all of the MAC addresses are drawn in a
+        single call and each address is formatted by bytes.hex().
+
+        """
+        suffix_len = 6 - len(prefix_octets)
+        random_octets = urandom(count * suffix_len)
+        return [
+            (
+                prefix_octets +
+                random_octets[i * suffix_len:(i + 1) * suffix_len]
+            ).hex(':')
+            for i in range(0, count)
         ]
-        return ":".join(["%2.2x" % octet for octet in mac_binary])
 
-    def __add_mac_addresses(self, node_class):
+    def __add_mac_addresses(self, node_class, prefix_octets):
         """Compute MAC address for every Virtual Node interface and
         overlay an 'addr_info.layer_2' that has AF_PACKET as its
         address family, and a list of MAC addresses in it. If that
         block already exists, then just make sure there are enough MAC
-        addresses in it, and supplement as needed.
+        addresses in it, and supplement as needed. New MAC addresses
+        start with the octets in 'prefix_octets'.
 
         """
         node_count = node_class.get('node_count', 0)
         interfaces = node_class.get('network_interfaces', {})
-        for key, interface in interfaces.items():
+        for interface in interfaces.values():
             layer_2 = interface.get(
                 "layer_2",
                 {
@@ -228,38 +298,39 @@ class PrivateCluster:
                     'addresses': [],
                 }
             )
-            existing_macs = layer_2.get('addresses', [])[0:node_count]
-            existing_count = len(existing_macs)
-            layer_2['addresses'] = existing_macs + [
-                self.__random_mac()
-                for i in range(0, node_count - existing_count)
-            ]
-            interface['addr_info'] = (
-                interface['addr_info'] if 'addr_info' in interface else
-                {}
+            # Take a (truncated) copy of any existing MAC addresses
+            # since the list may be shared with other configuration,
+            # then top it up in place.
+            mac_addrs = layer_2.get('addresses', [])[0:node_count]
+            mac_addrs.extend(
+                self.__random_macs(node_count - len(mac_addrs), prefix_octets)
             )
-            interface['addr_info']['layer_2'] = layer_2
-            interfaces[key] = interface
+            layer_2['addresses'] = mac_addrs
+            interface.setdefault('addr_info', {})['layer_2'] = layer_2
 
     def __add_xml_template(self, node_class):
         """Add the contents of the libvirt XML template for
         configuring a node class to the node class. This is done on a
         per-node class basis because it will be more flexible in the
         long run. For now it is the same data in ever node class,
-        which is a bit wasteful, but no big deal.
+        which is a bit wasteful, but no big deal. The template file is
+        only read the first time through, after that the same text is
+        reused for every node class.
 
         """
-        with open(VM_XML_PATH, 'r', encoding='UTF-8') as xml_template:
-            node_class['vm_xml_template'] = xml_template.read()
+        if self.vm_xml_template is None:
+            with open(VM_XML_PATH, 'r', encoding='UTF-8') as xml_template:
+                self.vm_xml_template = xml_template.read()
+        node_class['vm_xml_template'] = self.vm_xml_template
 
-    def __set_node_mac_addresses(self, blade_config):
+    def __set_node_mac_addresses(self, node_classes):
         """Compute and inject MAC addresses for every Virtual Node
         interface in all of the node classes.
 
         """
-        node_classes = self.__get_node_classes(blade_config)
-        for _, node_class in node_classes.items():
-            self.__add_mac_addresses(node_class)
+        prefix_octets = self.__mac_prefix_octets()
+        for node_class in node_classes.values():
+            self.__add_mac_addresses(node_class, prefix_octets)
 
     def prepare(self):
         """Prepare operation. This drives creation of the cluster
@@ -268,19 +339,23 @@ class PrivateCluster:
 
         """
         self.provider_api = self.stack.get_provider_api()
+        self.blade_counts = {}
+        self.blade_ips = {}
         blade_config = self.config
-        self.__expand_node_classes(blade_config)
-        self.__set_node_mac_addresses(blade_config)
+        node_classes = self.__get_node_classes(blade_config)
+        self.__expand_node_classes(node_classes)
+        self.__set_node_mac_addresses(node_classes)
         networks = self.config.get('networks', {})
+        virtual_blades = self.provider_api.get_virtual_blades()
         blade_config['networks'] = {
-            key: self.__add_endpoint_ips(network)
+            key: self.__add_endpoint_ips(network, virtual_blades)
             for key, network in networks.items()
             if not network.get('delete', False)
         }
-        for _, node_class in self.__get_node_classes(blade_config).items():
+        for node_class in node_classes.values():
             self.__add_xml_template(node_class)
         with open(self.blade_config_path, 'w', encoding='UTF-8') as conf:
-            safe_dump(blade_config, stream=conf)
+            dump(blade_config, stream=conf, Dumper=SafeDumper)
         self.prepared = True
 
     def validate(self):
@@ -295,6 +370,26 @@ class PrivateCluster:
             )
         print("Validating vtds-cluster-kvm")
 
+    def __upload_to_blade(self, connection, key_dir):
+        """Copy everything the deploy script needs onto the Virtual
+        Blade reached through 'connection': the blade SSH keys found in
+        'key_dir', the prepared blade configuration and the deploy
+        script itself.
+
+        """
+        connection.copy_to(
+            key_dir, '/root/ssh_keys',
+            recurse=True, logname='copy-ssh-keys-to'
+        )
+        connection.copy_to(
+            self.blade_config_path, "/root/blade_cluster_config.yaml",
+            recurse=False, logname="upload-cluster-config-to"
+        )
+        connection.copy_to(
+            DEPLOY_SCRIPT_PATH, "/root/%s" % DEPLOY_SCRIPT_NAME,
+            recurse=False, logname="upload-cluster-deploy-script-to"
+        )
+
     def deploy(self):
         """Deploy operation. This drives the deployment of cluster
         layer resources based on the layer definition. It can only be
@@ -310,38 +405,41 @@ class PrivateCluster:
         # the deployment script.
         virtual_blades = self.provider_api.get_virtual_blades()
         with virtual_blades.ssh_connect_blades() as connections:
-            # Copy the blade SSH keys out to the virtual blades so we
-            # can use them. Since each virtual blade class may have
-            # its own SSH key, we need to do this one at a time. It
-            # should be quick though.
-            info_msg("copying SSH keys to the blades")
-            for connection in connections.list_connections():
-                blade_type = connection.blade_type()
-                _, priv_path = virtual_blades.blade_ssh_key_paths(blade_type)
-                key_dir = dirname(priv_path)
-                connection.copy_to(
-                    key_dir, '/root/ssh_keys',
-                    recurse=True, logname='copy-ssh-keys-to'
-                )
+            # Copy the blade SSH keys, the blade configuration and
+            # the deploy script out to the virtual blades. The blades
+            # are independent of each other, so each blade gets its
+            # uploads in sequence, concurrently with the other blades.
             info_msg(
-                "copying '%s' to all Virtual Blades at "
-                "'/root/blade_cluster_config.yaml'" % (
-                    self.blade_config_path
+                "uploading SSH keys, '%s' and '%s' to all "
+                "Virtual Blades" % (
+                    self.blade_config_path, DEPLOY_SCRIPT_PATH
                 )
             )
-            connections.copy_to(
-                self.blade_config_path, "/root/blade_cluster_config.yaml",
-                recurse=False, logname="upload-cluster-config-to"
-            )
-            info_msg(
-                "copying '%s' to all Virtual Blades at '/root/%s'" % (
-                    DEPLOY_SCRIPT_PATH, DEPLOY_SCRIPT_NAME
+            blade_connections = list(connections.list_connections())
+            # Each virtual blade class may have its own SSH key, so
+            # find the key directory for each blade class in use.
+            key_dirs = {
+                blade_type: dirname(
+                    virtual_blades.blade_ssh_key_paths(blade_type)[1]
                 )
-            )
-            connections.copy_to(
-                DEPLOY_SCRIPT_PATH, "/root/%s" % DEPLOY_SCRIPT_NAME,
-                False, "upload-cluster-deploy-script-to"
-            )
+                for blade_type in {
+                    connection.blade_type()
+                    for connection in blade_connections
+                }
+            }
+            with ThreadPoolExecutor(
+                    max_workers=min(32, max(1, len(blade_connections)))
+            ) as executor:
+                uploads = [
+                    executor.submit(
+                        self.__upload_to_blade,
+                        connection, key_dirs[connection.blade_type()]
+                    )
+                    for connection in blade_connections
+                ]
+                for upload in uploads:
+                    # Raise any error that happened during the upload
+                    upload.result()
             cmd = (
                 "chmod 755 ./%s;" % DEPLOY_SCRIPT_NAME +
                 "python3 " +
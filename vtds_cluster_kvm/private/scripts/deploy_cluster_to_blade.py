@@ -35,6 +35,7 @@ import sys
 import os
 from os import (
     remove as remove_file,
+    replace as replace_file,
     makedirs
 )
 from os.path import (
@@ -43,20 +44,55 @@ from os.path import (
 )
 from subprocess import (
     Popen,
+    run,
     TimeoutExpired,
+    CalledProcessError,
     PIPE
 )
 from tempfile import (
     NamedTemporaryFile
 )
+from shutil import (
+    copyfileobj,
+    chown
+)
+from urllib.request import urlopen
+from http.client import HTTPException
 from uuid import uuid4
+from functools import lru_cache
 from time import sleep
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 import json
 from jinja2 import (
     Template,
     TemplateError
 )
 import yaml
+try:
+    # Use the LibYAML C bindings when they are available, they parse
+    # the blade configuration and emit netplan configuration much
+    # faster than the pure Python loader and dumper.
+    from yaml import (
+        CSafeLoader as SafeLoader,
+        CSafeDumper as SafeDumper
+    )
+except ImportError:
+    from yaml import (
+        SafeLoader,
+        SafeDumper
+    )
+
+
+# The libvirt network description used to bind a Virtual Network onto
+# the bridge mastering its tunnel.
+VIRTUAL_NETWORK_XML = """
+<network>
+  <name>%s</name>
+  <forward mode="bridge" />
+  <bridge name="%s" />
+</network>
+"""
 
 
 class ContextualError(Exception):
@@ -121,46 +157,55 @@ def info_msg(msg):
     write_err("INFO: %s\n" % msg)
 
 
-def run_cmd(cmd, args, stdin=sys.stdin, check=True, timeout=None):
-    """Run a command with output on stdout and errors on stderr
+def run_cmd(
+        cmd, args, stdin=sys.stdin, check=True, timeout=None, input_data=None
+):
+    """Run a command with output on stdout and errors on stderr. If
+    'input_data' (a string) is provided, it is fed to the command on
+    its standard input in place of 'stdin'.
 
     """
+    argv = [cmd, *args]
     exitval = 0
+    signaled = False
     try:
         with Popen(
-                [cmd, *args],
-                stdin=stdin, stdout=sys.stdout, stderr=sys.stderr
+                argv,
+                stdin=stdin if input_data is None else PIPE,
+                stdout=sys.stdout, stderr=sys.stderr
         ) as command:
-            time = 0
-            signaled = False
-            while True:
+            try:
+                command.communicate(
+                    input=(
+                        input_data.encode('UTF-8')
+                        if input_data is not None else None
+                    ),
+                    timeout=timeout
+                )
+                exitval = command.returncode
+            except TimeoutExpired:
+                # First try to terminate the process, then give it
+                # a few seconds to go before killing it.
+                signaled = True
+                command.terminate()
                 try:
                     exitval = command.wait(timeout=5)
                 except TimeoutExpired:
-                    time += 5
-                    if timeout and time > timeout:
-                        if not signaled:
-                            # First try to terminate the process
-                            command.terminate()
-                            continue
-                        command.kill()
-                        print()
-                        # pylint: disable=raise-missing-from
-                        raise ContextualError(
-                            "'%s' timed out and did not terminate "
-                            "as expected after %d seconds" % (
-                                " ".join([cmd, *args]),
-                                time
-                            )
+                    command.kill()
+                    print()
+                    # pylint: disable=raise-missing-from
+                    raise ContextualError(
+                        "'%s' timed out and did not terminate "
+                        "as expected after %d seconds" % (
+                            " ".join(argv),
+                            timeout + 5
                         )
-                    continue
-                # Didn't time out, so the wait is done.
-                break
+                    )
             print()
     except OSError as err:
         raise ContextualError(
             "executing '%s' failed - %s" % (
-                " ".join([cmd, *args]),
+                " ".join(argv),
                 str(err)
             )
         ) from err
@@ -170,18 +215,61 @@ def run_cmd(cmd, args, stdin=sys.stdin, check=True, timeout=None):
             if not signaled
             else "command '%s' timed out and was killed"
         )
-        raise ContextualError(fmt % " ".join([cmd, *args]))
+        raise ContextualError(fmt % " ".join(argv))
     return exitval
 
 
+def cmd_output(cmd, args):
+    """Run a command that reports information on its standard output,
+    wait for it to complete and return the (bytes) output.
+
+    """
+    argv = [cmd, *args]
+    try:
+        return run(argv, stdout=PIPE, stderr=PIPE, check=True).stdout
+    except OSError as err:
+        raise ContextualError(
+            "executing '%s' failed - %s" % (" ".join(argv), str(err))
+        ) from err
+    except CalledProcessError as err:
+        raise ContextualError(
+            "command '%s' failed - %s" % (
+                " ".join(argv),
+                err.stderr.decode('UTF-8', 'replace').strip()
+            )
+        ) from err
+
+
+def run_batch(cmd, batch):
+    """Run a list of sub-commands (each a list of arguments) through a
+    single invocation of an iproute2 command ('ip' or 'bridge') in
+    batch mode, so that a whole group of link operations costs one
+    process instead of one per operation. The batch stops at the first
+    failing sub-command, just as running them one at a time would.
+
+    """
+    lines = ["%s\n" % " ".join(args) for args in batch]
+    with NamedTemporaryFile(mode='w+', encoding='UTF-8') as batch_file:
+        batch_file.writelines(lines)
+        batch_file.flush()
+        try:
+            run_cmd(cmd, ["-batch", batch_file.name])
+        except ContextualError as err:
+            raise ContextualError(
+                "batch of '%s' commands failed - %s:\n%s" % (
+                    cmd, str(err), "".join(lines)
+                )
+            ) from err
+
+
 def read_config(config_file):
     """Read in the specified YAML configuration file for this blade
     and return the parsed data.
 
     """
     try:
-        with open(config_file, 'r', encoding='UTF-8') as config:
-            return yaml.safe_load(config)
+        with open(config_file, 'rb') as config:
+            return yaml.load(config, Loader=SafeLoader)
     except OSError as err:
         raise ContextualError(
             "failed to load blade configuration file '%s' - %s" % (
@@ -237,20 +325,17 @@ def blade_ipv4_cidr(network):
     return network.get('devices', {}).get('local', {}).get('interface', None)
 
 
-def network_connected(network, node_classes):
-    """Determine whether the specified network is connected to an
-    interface in any of the specified node classes. If it is return
-    True otherwise False.
+def connected_network_names(node_classes):
+    """Return the set of names of the networks that are connected to
+    an interface in any of the specified node classes.
 
     """
-    interface_connections = [
+    return {
         interface['cluster_network']
         for node_class in node_classes
-        if 'network_interfaces' in node_class
-        for _, interface in node_class['network_interfaces'].items()
+        for interface in node_class.get('network_interfaces', {}).values()
         if 'cluster_network' in interface
-    ]
-    return net_name(network) in interface_connections
+    }
 
 
 def node_addrs(network_interface, address_family):
@@ -265,10 +350,10 @@ def node_addrs(network_interface, address_family):
             "cofiguration error: network interface %s has no 'addr_info' "
             "section" % str(network_interface)
         ) from err
-    addrs = []
-    for _, info in addr_info.items():
+    found = None
+    for info in addr_info.values():
         if info.get('family', None) == address_family:
-            if addrs:
+            if found is not None:
                 raise ContextualError(
                     "configuration error: more than one '%s' addr_info "
                     "block found in "
@@ -276,8 +361,8 @@ def node_addrs(network_interface, address_family):
                         address_family, str(network_interface)
                     )
                 )
-            addrs += info.get('addresses', [])
-    return addrs
+            found = info
+    return found.get('addresses', []) if found is not None else []
 
 
 def node_mac_addrs(network_interface):
@@ -324,31 +409,30 @@ def find_addr_info(interface, family):
     ('interface').
 
     """
-    addr_infos = [
-        addr_info
-        for _, addr_info in interface.get('addr_info', {}).items()
-        if addr_info.get('family', None) == family
-    ]
-    if len(addr_infos) > 1:
-        netname = interface['cluster_network']
-        raise ContextualError(
-            "configuration error: the interface for network '%s' in a "
-            "node class has more than one '%s' 'addr_info' block: %s" % (
-                netname,
-                family,
-                str(interface)
-            )
-        )
-    if not addr_infos:
+    found = None
+    for addr_info in interface.get('addr_info', {}).values():
+        if addr_info.get('family', None) == family:
+            if found is not None:
+                raise ContextualError(
+                    "configuration error: the interface for network '%s' "
+                    "in a node class has more than one '%s' 'addr_info' "
+                    "block: %s" % (
+                        interface.get('cluster_network', ""),
+                        family,
+                        str(interface)
+                    )
+                )
+            found = addr_info
+    if found is None:
         raise ContextualError(
             "configuration error: the interface for network '%s' in the "
             "node class has no '%s' 'addr_info' block: %s" % (
-                netname,
+                interface.get('cluster_network', ""),
                 family,
                 str(interface)
             )
         )
-    return addr_infos[0]
+    return found
 
 
 def find_l3_config(network, family):
@@ -361,7 +445,7 @@ def find_l3_config(network, family):
     # with the specified family.
     l3_configs = [
         l3_config
-        for _, l3_config in network.get('l3_configs', {}).items()
+        for l3_config in network.get('l3_configs', {}).values()
         if l3_config.get('family', None) == family
     ]
     if len(l3_configs) > 1:
@@ -420,7 +504,7 @@ def find_blade_cidr(network, blade_class, blade_instance):
             " named '%s'" % netname
         )
     net_length = network_length(l3_config, netname)
-    return '/'.join((blade_ip, net_length))
+    return "%s/%s" % (blade_ip, net_length)
 
 
 def network_tunnel_name(network):
@@ -447,14 +531,15 @@ def node_connected_networks(node_class, networks):
     network name.
 
     """
-    if_nets = [
+    if_nets = {
         interface.get('cluster_network', "")
-        for _, interface in node_class.get('network_interfaces', {}).items()
-    ]
+        for interface in node_class.get('network_interfaces', {}).values()
+    }
+    named_networks = ((net_name(network), network) for network in networks)
     return {
-        net_name(network): network
-        for network in networks
-        if net_name(network) in if_nets
+        name: network
+        for name, network in named_networks
+        if name in if_nets
     }
 
 
@@ -511,12 +596,7 @@ def get_blade_interface_data():
     """Collect the interface data from the blade as a data structure.
 
     """
-    with Popen(
-        ["ip", "-d", "--json", "addr"],
-        stdout=PIPE,
-        stderr=PIPE
-    ) as cmd:
-        return json.loads(cmd.stdout.read())
+    return json.loads(cmd_output("ip", ["-d", "--json", "addr"]))
 
 
 def find_interconnect_interface():
@@ -552,9 +632,13 @@ def find_interconnect_interface():
     return candidates[0]
 
 
+@lru_cache(maxsize=None)
 def find_mtu(link_name):
     """Given the name of a network link (interface) return the MTU of
-    that link.
+    that link. MTUs are only looked up for Virtual Network bridges
+    once the Virtual Networks have been built, and they do not change
+    after that, so the answer for each link is remembered instead of
+    running 'ip' again for every Virtual Node interface on the bridge.
 
     """
     if_data = get_blade_interface_data()
@@ -595,16 +679,15 @@ def install_nat_rules(dhcp_networks):
     # Find the CIDRs of all the networks for which the blade's IP
     # matches the network's gateway IP. These are the ones that need
     # NAT.
+    l3_configs = (
+        find_l3_config(network, 'AF_INET') for network in dhcp_networks
+    )
     nat_cidrs = [
-        find_l3_config(network, 'AF_INET')['cidr']
-        for network in dhcp_networks
-        if find_l3_config(network, 'AF_INET').get(
-            'dhcp', {}
-        ).get(
-            'blade_host', {}
-        ).get('blade_ip', "") == find_l3_config(network, 'AF_INET').get(
-            'gateway', None
-        )
+        l3_config['cidr']
+        for l3_config in l3_configs
+        if l3_config.get('dhcp', {}).get('blade_host', {}).get(
+            'blade_ip', ""
+        ) == l3_config.get('gateway', None)
     ]
     if nat_cidrs:
         # We are going to add NAT, so Load the canonically necessary
@@ -626,6 +709,17 @@ def install_nat_rules(dhcp_networks):
             )
 
 
+@lru_cache(maxsize=None)
+def compile_template(source):
+    """Compile a Jinja2 template from its source text ('source') and
+    return it. All of the Virtual Nodes in a node class share the same
+    template, so compiled templates are remembered by source text
+    instead of being compiled again for every Virtual Node.
+
+    """
+    return Template(source)
+
+
 class NetworkInstaller:
     """A class to handle declarative creation of virtual networks on a
     blade.
@@ -637,13 +731,14 @@ class NetworkInstaller:
         easy inspection to determine what is already in place.
 
         """
-        if_data = get_blade_interface_data()
-        with Popen(
-                ["bridge", "--json", "fdb"],
-                stdout=PIPE,
-                stderr=PIPE
-        ) as cmd:
-            fdb_data = json.loads(cmd.stdout.read())
+        # Collect the forwarding database while the interface data is
+        # being collected, the two are independent.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            fdb_output = executor.submit(
+                cmd_output, "bridge", ["--json", "fdb"]
+            )
+            if_data = get_blade_interface_data()
+            fdb_data = json.loads(fdb_output.result())
         interfaces = {iface['ifname']: iface for iface in if_data}
         dsts = [fdb_entry for fdb_entry in fdb_data if 'dst' in fdb_entry]
         for dst in dsts:
@@ -661,22 +756,19 @@ class NetworkInstaller:
         easy inspection to determine what is already in place.
 
         """
-        with Popen(
-                ["virsh", "net-list", "--name"],
-                stdout=PIPE,
-                stderr=PIPE
-        ) as cmd:
-            vnets = [
-                line[:-1].decode('UTF-8') for line in cmd.stdout.readlines()
-                if line[:-1].decode('UTF-8')
-            ]
-        return vnets
+        output = cmd_output("virsh", ["net-list", "--name"]).decode('UTF-8')
+        return [line for line in output.splitlines() if line]
 
     def __init__(self):
         """Constructor
 
         """
-        self.interfaces = self._get_interfaces()
+        # Collect the libvirt networks while the interfaces are being
+        # collected, the two are independent.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            vnets = executor.submit(self._get_virtual_networks)
+            self.interfaces = self._get_interfaces()
+            self.vnets = vnets.result()
         self.vxlans = {
             key: val for key, val in self.interfaces.items()
             if 'linkinfo' in val and val['linkinfo']['info_kind'] == 'vxlan'
@@ -685,7 +777,16 @@ class NetworkInstaller:
             key: val for key, val in self.interfaces.items()
             if 'linkinfo' in val and val['linkinfo']['info_kind'] == 'bridge'
         }
-        self.vnets = self._get_virtual_networks()
+        # Index the local IP addresses on the blade by the interface
+        # that holds them for finding tunnel underlays.
+        self.local_ips = {}
+        for ifname, if_desc in self.interfaces.items():
+            for info in if_desc.get('addr_info', []):
+                if 'local' in info:
+                    self.local_ips.setdefault(info['local'], ifname)
+        # Virtual Networks are constructed concurrently, so protect the
+        # list of libvirt networks from simultaneous updates.
+        self.vnets_lock = Lock()
 
     def _check_conflict(self, name, bridge_name):
         """Look for conflicting existing interfaces for the named
@@ -713,22 +814,22 @@ class NetworkInstaller:
         to the virtual network.
 
         """
-        for intf, if_desc in self.interfaces.items():
-            addr_info = if_desc.get('addr_info', [])
-            for info in addr_info:
-                if 'local' in info and info['local'] in endpoint_ips:
-                    return (intf, info['local'])
+        for ip_addr in endpoint_ips:
+            if ip_addr in self.local_ips:
+                return (self.local_ips[ip_addr], ip_addr)
         raise ContextualError(
             "no network device was found with an IP address matching any of "
             "the following endpoint IPs: %s" % (str(endpoint_ips))
         )
 
     @staticmethod
-    def remove_link(if_name):
-        """Remove an interface (link) specified by the interface name.
+    def remove_links(if_names):
+        """Remove the interfaces (links) specified by a list of
+        interface names.
 
         """
-        run_cmd("ip", ["link", "del", if_name])
+        if if_names:
+            run_batch("ip", [["link", "del", if_name] for if_name in if_names])
 
     @staticmethod
     def add_new_tunnel(tunnel_name, bridge_name, vxlan_id, device):
@@ -737,37 +838,27 @@ class NetworkInstaller:
         which IPs and VMs can be bound.
 
         """
-        # Make the Tunnel Endpoint
-        run_cmd(
+        run_batch(
             "ip",
             [
-                "link", "add", tunnel_name,
-                "type", "vxlan",
-                "id", vxlan_id,
-                "dev", device,
-                "dstport", "4789",
+                # Make the Tunnel Endpoint
+                [
+                    "link", "add", tunnel_name,
+                    "type", "vxlan",
+                    "id", vxlan_id,
+                    "dev", device,
+                    "dstport", "4789",
+                ],
+                # Make the bridge device
+                ["link", "add", bridge_name, "type", "bridge"],
+                # Master the tunnel under the bridge
+                ["link", "set", tunnel_name, "master", bridge_name],
+                # Turn the bridge on
+                ["link", "set", bridge_name, "up"],
+                # Turn the tunnel on
+                ["link", "set", tunnel_name, "up"],
             ]
         )
-        # Make the bridge device
-        run_cmd(
-            "ip",
-            ["link", "add", bridge_name, "type", "bridge"]
-        )
-        # Master the tunnel under the bridge
-        run_cmd(
-            "ip",
-            ["link", "set", tunnel_name, "master", bridge_name]
-        )
-        # Turn the bridge on
-        run_cmd(
-            "ip",
-            ["link", "set", bridge_name, "up"]
-        )
-        # Turn the tunnel on
-        run_cmd(
-            "ip",
-            ["link", "set", tunnel_name, "up"]
-        )
 
     @staticmethod
     def add_blade_interface(peer_name, ifname, bridge_name, blade_cidr):
@@ -778,36 +869,24 @@ class NetworkInstaller:
         """
         if peer_name is None or ifname is None:
             return
-        # Create the interface / peer name
-        run_cmd(
-            "ip",
+        batch = [
+            # Create the interface / peer name
             [
                 "link", "add", ifname,
                 "type", "veth",
                 "peer", "name", peer_name,
-            ]
-        )
-        # Master the peer under the bridge
-        run_cmd(
-            "ip",
-            ["link", "set", peer_name, "master", bridge_name]
-        )
-        # Turn on the peer
-        run_cmd(
-            "ip",
-            ["link", "set", peer_name, "up"]
-        )
-        # Turn on the interface
-        run_cmd(
-            "ip",
-            ["link", "set", ifname, "up"]
-        )
+            ],
+            # Master the peer under the bridge
+            ["link", "set", peer_name, "master", bridge_name],
+            # Turn on the peer
+            ["link", "set", peer_name, "up"],
+            # Turn on the interface
+            ["link", "set", ifname, "up"],
+        ]
         if blade_cidr:
             # Add IP address to the interface
-            run_cmd(
-                "ip",
-                ["addr", "add", blade_cidr, "dev", ifname]
-            )
+            batch.append(["addr", "add", blade_cidr, "dev", ifname])
+        run_batch("ip", batch)
 
     @staticmethod
     def connect_endpoints(tunnel_name, endpoint_ips, local_ip_addr):
@@ -815,51 +894,42 @@ class NetworkInstaller:
         endpoints (blades) for the named network.
 
         """
-        remote_ips = [
-            ip_addr for ip_addr in endpoint_ips
+        batch = [
+            [
+                "fdb", "append", "to", "00:00:00:00:00:00",
+                "dst", ip_addr,
+                "dev", tunnel_name,
+            ]
+            for ip_addr in endpoint_ips
             if ip_addr != local_ip_addr
         ]
-        for ip_addr in remote_ips:
-            run_cmd(
-                "bridge",
-                [
-                    "fdb", "append", "to", "00:00:00:00:00:00",
-                    "dst", ip_addr,
-                    "dev", tunnel_name,
-                ],
-            )
+        if batch:
+            run_batch("bridge", batch)
 
     def add_virtual_network(self, network_name, bridge_name):
         """Add a network to libvirt that is bound onto the bridge that
         is mastering the tunnel for that network.
 
         """
-        net_desc = """
-<network>
-  <name>%s</name>
-  <forward mode="bridge" />
-  <bridge name="%s" />
-</network>
-        """ % (network_name, bridge_name)
-
-        with NamedTemporaryFile(mode='w+', encoding='UTF-8') as tmpfile:
-            tmpfile.write(net_desc)
-            tmpfile.flush()
-            run_cmd("virsh", ["net-define", tmpfile.name])
+        net_desc = VIRTUAL_NETWORK_XML % (network_name, bridge_name)
+        run_cmd("virsh", ["net-define", "/dev/stdin"], input_data=net_desc)
         run_cmd("virsh", ["net-start", network_name])
         run_cmd("virsh", ["net-autostart", network_name])
-        self.vnets.append(network_name)
+        with self.vnets_lock:
+            self.vnets.append(network_name)
 
     def remove_virtual_network(self, network_name):
         """Remove a network from libvirt
 
         """
-        if network_name not in self.vnets:
-            # Don't remove it if it isn't there
-            return
+        with self.vnets_lock:
+            if network_name not in self.vnets:
+                # Don't remove it if it isn't there
+                return
         run_cmd("virsh", ["net-destroy", network_name])
         run_cmd("virsh", ["net-undefine", network_name])
-        self.vnets.remove(network_name)
+        with self.vnets_lock:
+            self.vnets.remove(network_name)
 
     def construct_virtual_network(self, network, blade_cidr):
         """Create a VxLAN tunnel and bridge for a virtual network,
@@ -893,12 +963,13 @@ class NetworkInstaller:
         vxlan_id = str(network.get('tunnel_id', "0"))
         endpoint_ips = network.get('endpoint_ips', [])
         self._check_conflict(tunnel_name, bridge_name)
-        if tunnel_name in self.interfaces:
-            self.remove_link(tunnel_name)
-        if bridge_name in self.interfaces:
-            self.remove_link(bridge_name)
-        if blade_peer_name in self.interfaces:
-            self.remove_link(blade_peer_name)
+        self.remove_links(
+            [
+                if_name
+                for if_name in (tunnel_name, bridge_name, blade_peer_name)
+                if if_name in self.interfaces
+            ]
+        )
         device, local_ip_addr = self._find_underlay(endpoint_ips)
         self.add_new_tunnel(tunnel_name, bridge_name, vxlan_id, device)
         self.connect_endpoints(tunnel_name, endpoint_ips, local_ip_addr)
@@ -933,6 +1004,7 @@ class VirtualNode:
         self.host_dir = path_join(self.nodeclass_dir, self.hostname)
         makedirs(self.host_dir, mode=0o755, exist_ok=True)
         self.boot_disk_name = None
+        self.netplan_name = path_join(self.host_dir, 'netplan.yaml')
         try:
             self.virtual_machine = self.node_class['virtual_machine']
         except KeyError as err:
@@ -965,7 +1037,7 @@ class VirtualNode:
             raise ContextualError(
                 "configuration error: Virtual Node class '%s' has no "
                 "'base_name' in its 'node_naming' section: %s" % (
-                    self.class_name(), str(self.node_class)
+                    self.class_name, str(self.node_class)
                 )
             ) from err
         node_names = node_naming.get('node_names', [])
@@ -981,18 +1053,37 @@ class VirtualNode:
         file named in 'dest'.
 
         """
-        # Using curl here instead of writing a requests library
-        # operation because it is simpler and just about as fast and
-        # the error handling is covered. If the destination file
-        # already exists, simply return. If retrieval fails, remove
-        # any partial destination file that might have been created.
-        if not exists(dest):
-            try:
-                run_cmd('curl', ['-o', dest, '-s', url])
-            except Exception as err:
-                if exists(dest):
-                    remove_file(dest)
-                raise err
+        # If the destination file already exists, simply return.
+        # Otherwise stream the image into a partial file next to the
+        # destination and only move it into place once it is complete,
+        # so a failed retrieval never leaves a truncated image behind
+        # to be mistaken for a good one later.
+        if exists(dest):
+            return
+        partial = "%s.part" % dest
+        try:
+            with urlopen(url, timeout=60) as response, \
+                 open(partial, 'wb') as image:
+                copyfileobj(response, image, 1024 * 1024)
+                received = image.tell()
+                expected = response.headers.get('Content-Length', None)
+            # A server that closes the connection early just produces a
+            # short read, so check that the whole image arrived.
+            if expected is not None and received != int(expected):
+                raise ContextualError(
+                    "image is truncated, received %d of %s bytes" % (
+                        received, expected
+                    )
+                )
+            replace_file(partial, dest)
+        except (OSError, ValueError, HTTPException, ContextualError) as err:
+            if exists(partial):
+                remove_file(partial)
+            raise ContextualError(
+                "failed to retrieve disk image from '%s' into '%s' - %s" % (
+                    url, dest, str(err)
+                )
+            ) from err
 
     @staticmethod
     # Take this out when we start using partitions
@@ -1006,10 +1097,8 @@ class VirtualNode:
         disk accordingly.
 
         """
-        run_cmd(
-            'rm',
-            ['-f', name]
-        )
+        if exists(name):
+            remove_file(name)
         # pylint: disable=fixme
         # TODO implement partitioning
         source_options = (
@@ -1022,10 +1111,13 @@ class VirtualNode:
             'qemu-img',
             ['create', *source_options, '-f', 'qcow2', name, *size_args]
         )
-        run_cmd(
-            'chown',
-            ['libvirt-qemu:kvm', name]
-        )
+        try:
+            chown(name, user='libvirt-qemu', group='kvm')
+        except (OSError, LookupError) as err:
+            raise ContextualError(
+                "failed to give ownership of disk image '%s' to "
+                "'libvirt-qemu:kvm' - %s" % (name, str(err))
+            ) from err
 
     def __make_disk(self, name, disk_config, source_image_name=None):
         """Given an the filename ('name') to store the boot disk file,
@@ -1127,16 +1219,12 @@ class VirtualNode:
 
     def __configure_netplan(self, context):
         """Given the network interfaces portion of a VM template
-        context ('context') configure the netplan on this instance's
-        boot disk image to bring up all of the network interfaces as
-        configured.
+        context ('context') compose the netplan that will bring up all
+        of the network interfaces as configured and write it into the
+        host directory to be installed on this instance's boot disk
+        image when the Virtual Node is created.
 
         """
-        if not self.boot_disk_name or not exists(self.boot_disk_name):
-            raise ContextualError(
-                "internal error: __configure_netplan run before the "
-                "boot disk image was created"
-            )
         netplan = {
             'network': {
                 'version': "2",
@@ -1145,11 +1233,9 @@ class VirtualNode:
                     interface['ifname']: {
                         'addresses': (
                             [
-                                '/'.join(
-                                    [
-                                        interface['ipv4_addr'],
-                                        interface['ipv4_netlength']
-                                    ]
+                                "%s/%s" % (
+                                    interface['ipv4_addr'],
+                                    interface['ipv4_netlength']
                                 )
                             ]
                             if interface['ipv4_addr'] is not None
@@ -1166,33 +1252,8 @@ class VirtualNode:
                 }
             }
         }
-        with NamedTemporaryFile(mode='w', encoding='UTF-8') as tmpfile:
-            yaml.safe_dump(netplan, tmpfile)
-            tmpfile.flush()
-            run_cmd(
-                'virt-customize',
-                [
-                    '-a', self.boot_disk_name,
-                    '--upload',
-                    "%s:/etc/netplan/10-vtds-ethernets.yaml" % tmpfile.name
-                ]
-            )
-
-    def __reconfigure_ssh(self):
-        """Run 'dpkg-recofigure openssh-server' on the root disk so
-        that the SSH servers will have host keys. Also, install root
-        SSH keys and authorizations.
-
-        """
-        run_cmd(
-            'virt-customize',
-            [
-                '-a', self.boot_disk_name,
-                '--run-command', 'dpkg-reconfigure openssh-server',
-                '--copy-in', '/root/.ssh:/root',
-                '--hostname', self.hostname,
-            ]
-        )
+        with open(self.netplan_name, 'w', encoding='UTF-8') as netplan_file:
+            yaml.dump(netplan, netplan_file, Dumper=SafeDumper)
 
     def __make_network_interface(self, interface, network):
         """Given an interface configuration ('interface') taken from a
@@ -1225,7 +1286,7 @@ class VirtualNode:
             blade_instance >= len(addresses)
         )
         ipv4_addr = (
-            addresses[self.blade_instance]
+            addresses[blade_instance]
             if blade_instance < len(addresses)
             else None
         )
@@ -1258,21 +1319,25 @@ class VirtualNode:
             self.__make_network_interface(
                 interface, self.networks[interface['cluster_network']]
             )
-            for _, interface in self.node_class.get(
+            for interface in self.node_class.get(
                 'network_interfaces', {}
-            ).items()
+            ).values()
         ]
         self.__configure_netplan(context)
         return context
 
-    def __configure_root_passwd(self):
-        """Configure the root password on the boot disk image for the
-        Virtual Node.
+    def __customize_boot_disk(self):
+        """Install the netplan, run 'dpkg-recofigure openssh-server' so
+        that the SSH servers will have host keys, install root SSH keys
+        and authorizations, set the host name and configure the root
+        password on the boot disk image for the Virtual Node. All of
+        this is done in a single run of 'virt-customize' so that only
+        one libguestfs appliance is booted per Virtual Node.
 
         """
         if not self.boot_disk_name or not exists(self.boot_disk_name):
             raise ContextualError(
-                "internal error: __configure_root_passwd run before the "
+                "internal error: __customize_boot_disk run before the "
                 "boot disk image was created"
             )
         # pylint: disable=fixme
@@ -1288,6 +1353,12 @@ class VirtualNode:
             'virt-customize',
             [
                 '-a', self.boot_disk_name,
+                '--no-network',
+                '--upload',
+                "%s:/etc/netplan/10-vtds-ethernets.yaml" % self.netplan_name,
+                '--run-command', 'dpkg-reconfigure openssh-server',
+                '--copy-in', '/root/.ssh:/root',
+                '--hostname', self.hostname,
                 '--root-password', 'password:%s' % root_passwd,
             ]
         )
@@ -1346,7 +1417,6 @@ class VirtualNode:
         it on the current blade.
 
         """
-        self.__reconfigure_ssh()
         try:
             vm_template = self.node_class['vm_xml_template']
         except KeyError as err:
@@ -1355,20 +1425,16 @@ class VirtualNode:
                 "not have a VM XML template stored in it. This may be some "
                 "kind of module version mismatch."
             ) from err
-        self.__configure_root_passwd()
-        template = Template(vm_template)
+        self.__customize_boot_disk()
         try:
-            vm_xml = template.render(**self.context)
+            vm_xml = compile_template(vm_template).render(**self.context)
         except TemplateError as err:
             raise ContextualError(
                 "internal error: error rendering VM XML file from context and "
                 "XML template - %s" % str(err)
             ) from err
-        with NamedTemporaryFile(mode='w', encoding='UTF-8') as tmpfile:
-            tmpfile.write(vm_xml)
-            tmpfile.flush()
-            run_cmd('virsh', ['define', tmpfile.name])
-            run_cmd('virsh', ['start', self.hostname])
+        run_cmd('virsh', ['define', '/dev/stdin'], input_data=vm_xml)
+        run_cmd('virsh', ['start', self.hostname])
 
     def stop(self):
         """Stop but do not undefine the Virtual Node.
@@ -1393,32 +1459,34 @@ class KeaDHCP4:
         """
         # Get a dictionary of networks indexed by name for which this
         # blade is the DHCP server.
-        self.nets_by_name = {
-            net_name(network): network
-            for _, network in config.get('networks', {}).items()
-            if find_l3_config(network, 'AF_INET').get(
-                    'dhcp', {}
-            ).get('blade_host', {}).get('blade_class', None) == blade_class
-            and str(
-                find_l3_config(network, 'AF_INET').get(
-                    'dhcp', {}
-                ).get(
+        blade_hosts = (
+            (
+                network,
+                find_l3_config(network, 'AF_INET').get('dhcp', {}).get(
                     'blade_host', {}
                 )
-                .get('blade_instance', None)
-            ) == blade_instance
+            )
+            for network in config.get('networks', {}).values()
+        )
+        self.nets_by_name = {
+            net_name(network): network
+            for network, blade_host in blade_hosts
+            if blade_host.get('blade_class', None) == blade_class
+            and str(blade_host.get('blade_instance', None)) == blade_instance
         }
-        # Get a list of Virtual Node network interfaces that are
-        # connected to one of the networks for which this blade is a
-        # DHCP server.
-        self.network_interfaces = [
-            interface
-            for _, node_class in config.get('node_classes', {}).items()
-            for _, interface in node_class.get(
+        # Get the lists of Virtual Node network interfaces that are
+        # connected to each of the networks for which this blade is a
+        # DHCP server, indexed by network name.
+        self.interfaces_by_net = {}
+        for node_class in config.get('node_classes', {}).values():
+            for interface in node_class.get(
                     'network_interfaces', {}
-            ).items()
-            if if_network(interface) in self.nets_by_name
-        ]
+            ).values():
+                netname = if_network(interface)
+                if netname in self.nets_by_name:
+                    self.interfaces_by_net.setdefault(netname, []).append(
+                        interface
+                    )
         self.dhcp4_config = self.__compose_config()
 
     def __compose_reservations(self, interfaces):
@@ -1492,13 +1560,8 @@ class KeaDHCP4:
         block as its own subnet.
 
         """
-        # Further filter network interfaces to get only those that
-        # apply to this network itself.
-        interfaces = [
-            interface
-            for interface in self.network_interfaces
-            if if_network(interface) == net_name(network)
-        ]
+        # Get the network interfaces that apply to this network itself.
+        interfaces = self.interfaces_by_net.get(net_name(network), [])
         blade_if = blade_ipv4_ifname(network)
         l3_config = find_l3_config(network, 'AF_INET')
         subnet = (
@@ -1513,7 +1576,7 @@ class KeaDHCP4:
         """
         return [
             netconf
-            for _, network in self.nets_by_name.items()
+            for network in self.nets_by_name.values()
             for netconf in self.__compose_network(network)
         ]
 
@@ -1526,20 +1589,14 @@ class KeaDHCP4:
         # through which the blade can access the Virtual Network)
         # associated with all of the networks this blade serves. These
         # will be the interfaces this instance of DHCP4 listens on. We
-        # do this using a set comprehension because there are likely
-        # duplicates in the list
+        # do this by looking up the blade interface once for each
+        # network that has Virtual Node interfaces on it, since there
+        # are likely many interfaces on each network.
         if_names = {
-            self.nets_by_name[
-                if_network(network_interface)
-            ]['devices']['local']['interface']
-            for network_interface in self.network_interfaces
-            if (
-                blade_ipv4_ifname(
-                    self.nets_by_name[if_network(network_interface)]
-                )
-                is not None
-            )
+            blade_ipv4_ifname(self.nets_by_name[name])
+            for name in self.interfaces_by_net
         }
+        if_names.discard(None)
         return {
             'Dhcp4': {
                 'valid-lifetime': 4000,
@@ -1563,10 +1620,7 @@ class KeaDHCP4:
         the list of networks for which this blade is a DHCP server.
 
         """
-        return [
-            network
-            for _, network in self.nets_by_name.items()
-        ]
+        return list(self.nets_by_name.values())
 
     def write_config(self, filename):
         """Write out the configuration into the specified filname.
@@ -1596,7 +1650,8 @@ class KeaDHCP4:
                 if cmd.wait() == 0:
                     # It's active we are done here...
                     return
-                sleep(1)
+            sleep(1)
+            timeout -= 1
         # The server never became active. Run a systemctl status
         # capturing the output and then raise an error reporting the
         # failure and the status.
@@ -1604,7 +1659,7 @@ class KeaDHCP4:
             ['systemctl', 'status', 'kea-dhcp4-server'],
             stdout=PIPE
         ) as cmd:
-            status = cmd.stdout.read()
+            status = cmd.stdout.read().decode('UTF-8', 'replace')
             raise ContextualError(
                 "when restarting kea-dhcp4-server the service timed out "
                 "while waiting to become active. "
@@ -1630,6 +1685,9 @@ def main(argv):
     config = read_config(argv[2])
     key_dir = argv[3]
     install_blade_ssh_keys(key_dir)
+    # Have libguestfs (virt-customize) launch its appliance directly
+    # instead of through libvirt unless the blade says otherwise.
+    os.environ.setdefault('LIBGUESTFS_BACKEND', 'direct')
     network_installer = NetworkInstaller()
     network_installer.remove_virtual_network("default")
     # Only work with node classes that are hosted on our blade
@@ -1643,7 +1701,7 @@ def main(argv):
     for class_name, node_class in node_classes.items():
         node_class['class_name'] = class_name
     node_classes = [
-        node_class for _, node_class in node_classes.items()
+        node_class for node_class in node_classes.values()
         if (
             node_class
             .get('host_blade', {})
@@ -1652,17 +1710,28 @@ def main(argv):
     ]
     # Only work with networks that are connected to our blade class.
     # Turn the map into a list and filter out any irrelevant networks.
-    networks = config.get('networks', {})
+    connected_names = connected_network_names(node_classes)
     networks = [
         network
-        for _, network in networks.items()
-        if network_connected(network, node_classes)
+        for network in config.get('networks', {}).values()
+        if net_name(network) in connected_names
     ]
-    # Build the virtual networks for the cluster.
-    for network in networks:
-        network_installer.construct_virtual_network(
-            network, find_blade_cidr(network, blade_class, blade_instance)
-        )
+    # Build the virtual networks for the cluster. Each network only
+    # touches its own tunnel, bridge, veth pair and libvirt network, so
+    # they can all be built at the same time.
+    with ThreadPoolExecutor(
+            max_workers=min(16, max(1, len(networks)))
+    ) as executor:
+        futures = [
+            executor.submit(
+                network_installer.construct_virtual_network,
+                network,
+                find_blade_cidr(network, blade_class, blade_instance)
+            )
+            for network in networks
+        ]
+        for future in futures:
+            future.result()
 
     # Configure Kea on this blade to serve DHCP4 for the networks
     # served by this blade.
@@ -1677,26 +1746,33 @@ def main(argv):
     # Virtual Node to be created. Each node class specifies a blade
     # capacity for nodes of that class, so only create the instances
     # of that class that belong on this blade (i.e. spread them across
-    # the blades).
-    nodes = [
-        VirtualNode(
-            node_class,
-            node_connected_networks(node_class, networks),
-            instance
-        )
-        for node_class in node_classes
-        for instance in range(
-            *instance_range(node_class, blade_instance)
+    # the blades). All of the instances of a node class are connected
+    # to the same networks, so only look those up once per class.
+    nodes = []
+    for node_class in node_classes:
+        connected_networks = node_connected_networks(node_class, networks)
+        nodes += [
+            VirtualNode(node_class, connected_networks, instance)
+            for instance in range(
+                *instance_range(node_class, blade_instance)
+            )
+        ]
+    info_msg(
+        "Virtual Nodes on this blade: %s" % ", ".join(
+            node.hostname for node in nodes
         )
-    ]
-    print("nodes: %s" % str(nodes))
+    )
     # Now remove any Virtual Nodes that are in our list and are
-    # currently deployed.
-    for node in nodes:
-        node.remove()
-    # Now create all the Virtual Nodes in the list
-    for node in nodes:
-        node.create()
+    # currently deployed, then create all the Virtual Nodes in the
+    # list. Each Virtual Node is independent of the others, so do this
+    # concurrently, but keep the number of simultaneous virt-customize
+    # appliances in line with the CPUs on the blade.
+    max_workers = min(max(1, len(nodes)), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in [executor.submit(node.remove) for node in nodes]:
+            future.result()
+        for future in [executor.submit(node.create) for node in nodes]:
+            future.result()
 
 
 def entrypoint(usage_msg, main_func):